@@ -1,11 +1,42 @@
 from flask import Flask, request, render_template
 from searchengine import SearchEngine  # Assuming your search engine code is in search_engine.py
 import whoosh
+from functools import lru_cache
+from collections import deque
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # initialize all variables
 app = Flask(__name__)
 search_engine = SearchEngine('https://en.wikipedia.org/wiki/Home_page', 100)
-search_history = []
+# keep search_history to at most 10 entries, the oldest query is dropped automatically
+search_history = deque(maxlen=10)
+# requests can be served by several threads, so search_history is only used while holding this lock
+search_history_lock = threading.Lock()
+# runs the recommendations next to the search itself
+executor = ThreadPoolExecutor(max_workers=8)
+# parses the queries that are corrected for our recommendations
+correction_parser = whoosh.qparser.QueryParser("content", search_engine.ix.schema)
+
+@lru_cache(maxsize=4096)
+def get_recommendation(query: str) -> str:
+    """
+    Corrects the given query with the words of our index.
+    The index does not change while the app is running, so results are cached per query.
+
+    :param query: The query as it was entered by the user.
+    :return: The corrected query or an empty string if the query needs no correction.
+    """
+    q = correction_parser.parse(query)
+
+    with search_engine.ix.searcher() as searcher:
+        corrected = searcher.correct_query(q, query)
+
+        # if our query is different from the with our index corrected one we get recommendations
+        if corrected.query != q:
+            return corrected.string
+
+    return ""
 
 @app.route('/')
 def home():
@@ -14,7 +45,10 @@ def home():
     
     :return: Rendered template of the home page.
     """
-    return render_template('home_page_template2.html', history = reversed(search_history))
+    # copy the history so it cannot change while the template is rendered
+    with search_history_lock:
+        history = list(reversed(search_history))
+    return render_template('home_page_template2.html', history = history)
 
 @app.route('/search')
 def search():
@@ -25,28 +59,17 @@ def search():
     """
     # receive query
     query = request.args.get('q', '')
+    # use the previously created index for our recommendations (only used in html when the query does not return any urls)
+    # they do not depend on the search results, so they are computed at the same time
+    recommendation_future = executor.submit(get_recommendation, query)
     # find urls in our index
     word_con_urls_tit = search_engine.search(query.split())
-    # initialize recommendation as empty string that only fills if correct_query() returns something different than the query
-    recommendation = ""
 
     # expand search_history without duplicates
-    if query not in search_history and query != "":
-        search_history.append(query)
+    with search_history_lock:
+        if query not in search_history and query != "":
+            search_history.append(query)
 
-    # keep search_history to at most 10 entries
-    if len(search_history) > 10:
-        search_history.pop(0)
+    recommendation = recommendation_future.result()
 
-    # use the previously created index for our recommendations (only used in html when the query does not return any urls)
-    qp = whoosh.qparser.QueryParser("content", search_engine.ix.schema)
-    q = qp.parse(query)
-
-    with search_engine.ix.searcher() as searcher:
-        corrected = searcher.correct_query(q, query)
-
-        # if our query is different from the with our index corrected one we get recommendations
-        if corrected.query != q:
-            recommendation = corrected.string
-            
     return render_template('search_results_template.html',word_con_urls_tit = word_con_urls_tit, length = len(word_con_urls_tit), query = query, recommendation = recommendation)
\ No newline at end of file
@@ -3,10 +3,20 @@ import os
 from whoosh.index import create_in, open_dir, exists_in
 from whoosh.fields import Schema, TEXT, ID
 from whoosh.qparser import QueryParser, AndGroup
-from bs4 import BeautifulSoup
+from whoosh import highlight
+import lxml.html
+import lxml.etree
 import re
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import DEFAULT_POOLSIZE
 from typing import List, Tuple, Optional
 
+# splits text into words and punctuation marks
+_TOKEN_RE = re.compile(r"[\w']+|[.,!?;]")
+# matches runs of whitespace
+_WS_RE = re.compile(r'\s+')
+# matches an XML declaration at the start of a page
+_XML_DECL_RE = re.compile(r'^\s*<\?xml[^>]*\?>')
 
 
 class SearchEngine:
@@ -17,7 +27,8 @@ class SearchEngine:
         # Define the schema for indexing
         self.schema = Schema(
             url=ID(stored=True, unique=True),
-            content=TEXT(stored=True),
+            # store the character offsets of every term so Whoosh can build the context snippets without re-tokenizing
+            content=TEXT(stored=True, chars=True),
             title=TEXT(stored=True)
 
         )
@@ -27,6 +38,8 @@ class SearchEngine:
             self.ix = create_in(self.index_dir, self.schema)
         else:
             self.ix = open_dir(self.index_dir)
+        # Using the AndGroup to require all words in the query
+        self.parser = QueryParser("content", self.ix.schema, group=AndGroup)
 
     def build_index(self) -> None:
         """
@@ -38,21 +51,51 @@ class SearchEngine:
         """
         # build index only if it does not exist yet
         if not self.is_index_built():
-            writer = self.ix.writer()
             self.crawler.crawl()
-            # extract all information for the index from the url
-            for url in self.crawler.visited:
-                content = self.crawler.get_content(url)
-                soup = BeautifulSoup(content, 'html.parser')
-                content = self.clean_text(content)
-                # Extract the title and convert to a plain string
-                # add str() to avoid max depth recursion error
-                title = soup.title.string if soup.title else 'No Title'
-                title = str(title).strip()
-                # and add information to the index directory
-                if content is not None:                                   
-                    writer.add_document(url=url, content=content, title = title)
-            writer.commit()
+            # extract all information for the index from the urls in parallel
+            # the writer is only opened afterwards, so the lock of the index is not held during the network requests
+            with ThreadPoolExecutor(max_workers=DEFAULT_POOLSIZE) as executor:
+                pages = list(executor.map(self._fetch_and_clean, self.crawler.visited))
+
+            # use a bigger buffer so fewer temporary runs are written while indexing
+            writer = self.ix.writer(limitmb=256)
+            try:
+                for url, content, title in pages:
+                    # and add information to the index directory
+                    if content is not None:
+                        writer.add_document(url=url, content=content, title = title)
+                # merge everything into one segment for faster searches
+                writer.commit(optimize=True)
+            except BaseException:
+                # release the lock of the index
+                writer.cancel()
+                raise
+
+    def _fetch_and_clean(self, url: str) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        Fetches a web page and extracts the information needed for the index
+
+        :param url: The URL of the page to fetch.
+        :return: A tuple of the URL, the cleaned text and the title of the page, text and title are None if the page could not be fetched or processed
+        """
+        # a single failing page should not abort building the whole index
+        try:
+            content = self.crawler.get_content(url)
+            if content is None:
+                return url, None, None
+
+            # parse the page only once for the title and the text
+            tree = self._parse_html(content)
+            if tree is None:
+                return url, '', 'No Title'
+
+            # Extract the title as a plain string
+            title = tree.findtext('.//title')
+            title = title.strip() if title else 'No Title'
+            return url, self._extract_text(tree), title
+        except Exception as e:
+            print(f"Indexing {url} failed: {e}")
+            return url, None, None
     
     def is_index_built(self) -> bool:
         """
@@ -83,44 +126,29 @@ class SearchEngine:
                 the URL, and the title of the page where the words were found. The list is sorted by the count of 
                 word occurrences in descending order.
         """
-        # Open the existing index directory
-        ix = open_dir(self.index_dir)
-
-        # Use Whoosh's searcher
-        with ix.searcher() as searcher:
-            # Using the AndGroup to require all words in the query
-            parser = QueryParser("content", ix.schema, group=AndGroup)
+        # Use Whoosh's searcher on the index opened in __init__
+        with self.ix.searcher() as searcher:
             # Create a query string that includes all words
             query_str = ' AND '.join(words)
             # Parse the query string
-            query = parser.parse(query_str)
+            query = self.parser.parse(query_str)
 
-            # Perform the search
-            results = searcher.search(query,limit=self.max_pages)
+            # Perform the search and remember the matched terms for highlighting
+            results = searcher.search(query, limit=self.max_pages, terms=True)
+            # let Whoosh cut a plain text context snippet around the matched terms
+            results.fragmenter = highlight.PinpointFragmenter(surround=40, autotrim=True)
+            results.formatter = highlight.NullFormatter()
 
-            # Collect the URLs and titles from the results
+            # Collect the URLs, titles and context snippets from the results
             urls = [result['url'] for result in results]
             titles = [result['title'] for result in results]
-            # initialize context and word_occurences for displayed information on search results
-            word_occurrences = [0] * len(urls)
-            context = [0] * len(urls)
-
-            # Iterate through the results and count word occurrences
-            for indx, result in enumerate(results):
-
-                # Convert content to lowercase and split into words
-                soup = BeautifulSoup(result['content'], 'html.parser')
-                text_content = soup.get_text(separator=' ', strip=True)
-                content_for_context = re.findall(r"[\w']+|[.,!?;]", text_content)
-                content = re.findall(r"[\w']+|[.,!?;]", text_content.lower())
-
-                # count the word occurrences
-                for spot, word in enumerate(content):
-                    if word in words:
-                        word_occurrences[indx] += 1
-                        context[indx] = content_for_context[spot-4: spot+5]
-                        context[indx] = (" ".join(context[indx])).replace(' .','.').replace(' ,',',')
-
+            context = [result.highlights('content', top=1) for result in results]
+            # compare the query words in lowercase, like the page content, and use a set for fast lookups
+            words_set = {word.lower() for word in words}
+            # count the word occurrences for displayed information on search results
+            # content was already cleaned while building the index, so it can be split into words directly
+            word_occurrences = [sum(1 for word in _TOKEN_RE.findall(result['content'].lower()) if word in words_set)
+                                for result in results]
 
             # zip information into one to search through
             context_urls_titles = zip(context, urls, titles)
@@ -134,30 +162,19 @@ class SearchEngine:
                     word_con_urls_tit[i] = [word_occurrences[i], context_word, url, title]
             
             # filter out duplicates from found results and choose the shortest url for each duplicate
-            compare_titles = [0] * len(word_con_urls_tit)
-            compare_urls = [0] * len(word_con_urls_tit)
+            # maps every title to the position of its entry with the shortest url
+            best_by_title = {}
 
             for i, entry in enumerate(word_con_urls_tit):
                 # ignore empty entries as they will be removed later anyway
                 if entry != 0:
-                    # build list filled with unique titles and urls
-                    if entry[3] not in compare_titles:
-                        compare_titles[i] = entry[3]
-                        compare_urls[i] = entry[2]
-                    # if a duplicate website is found
-                    else:
-                        # determine which entry in the results should be removed based on url length
-                        for idx, title in enumerate(compare_titles):
-                            # at the spot where the duplicate is located
-                            if title == entry[3]:
-                                # remove the entry with the longer url from the results
-                                if len(entry[2]) < len(compare_urls[idx]):
-                                    word_con_urls_tit[idx] = 0
-                                else:
-                                    word_con_urls_tit[i] = 0
-            
+                    title = entry[3]
+                    # keep the first entry for a title unless a duplicate website has a shorter url
+                    if title not in best_by_title or len(entry[2]) < len(word_con_urls_tit[best_by_title[title]][2]):
+                        best_by_title[title] = i
+
             # Convert the dictionary to a list of tuples and sort by count in descending order
-            word_con_urls_tit = [elem for elem in word_con_urls_tit if elem != 0]
+            word_con_urls_tit = [word_con_urls_tit[i] for i in best_by_title.values()]
             word_con_urls_tit = sorted(word_con_urls_tit, reverse = True)
 
         return word_con_urls_tit
@@ -172,16 +189,43 @@ class SearchEngine:
         # Parse HTML content
         # only execute if there is any content at all
         if html_content is not None:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            tree = self._parse_html(html_content)
+            html_content = self._extract_text(tree) if tree is not None else ''
+
+        return html_content
+
+    def _parse_html(self, html_content: str) -> Optional[lxml.html.HtmlElement]:
+        """
+        Parse HTML content with lxml.
 
-            # Remove script and style elements
-            for script_or_style in soup(['script', 'style']):
-                script_or_style.decompose()
+        :param html_content: The HTML content to be parsed.
+        :return: The parsed document, or None if it is empty or cannot be parsed.
+        """
+        # lxml refuses empty documents, so skip them before parsing
+        if not html_content.strip():
+            return None
+        try:
+            try:
+                return lxml.html.fromstring(html_content)
+            except ValueError:
+                # str input must not carry an XML encoding declaration, the page is already decoded so drop it
+                return lxml.html.fromstring(_XML_DECL_RE.sub('', html_content, count=1))
+        except (lxml.etree.ParserError, ValueError):
+            # e.g. documents that only consist of comments
+            return None
+
+    def _extract_text(self, tree: lxml.html.HtmlElement) -> str:
+        """
+        Extract human-readable text from a parsed HTML document.
 
-            # Get text and replace HTML entities
-            html_content = soup.get_text()
+        :param tree: The parsed HTML document, script and style elements are removed from it.
+        :return: Cleaned, human-readable text.
+        """
+        # Remove script and style elements
+        lxml.etree.strip_elements(tree, 'script', 'style', with_tail=False)
 
-            # Replace multiple spaces with a single space and strip leading/trailing whitespace
-            html_content = re.sub(r'\s+', ' ', html_content).strip()
+        # Get text and replace HTML entities
+        text = tree.text_content()
 
-        return html_content
\ No newline at end of file
+        # Replace multiple spaces with a single space and strip leading/trailing whitespace
+        return _WS_RE.sub(' ', text).strip()